@@ -0,0 +1,129 @@
+"""
+Gate kernels operating in place on a flat amplitude buffer.
+
+Numba is optional: when it is not installed NUMBA_AVAILABLE is False and
+State falls back to the array kernels, which are generated per qubit count
+and qubit index so their strides are literals. The array kernels only use
+ndarray methods and work on both NumPy and CuPy arrays.
+"""
+
+from functools import lru_cache
+
+try:
+    from numba import njit, prange
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Below this size the statevector fits in cache and NumPy is fast enough
+NUMBA_MIN_QUBITS = 14
+
+
+def _compile(src: str):
+    """Compile the source of a single function named kernel and return it."""
+    namespace = {}
+    exec(compile(src, "<kernel>", "exec"), {}, namespace)
+    return namespace["kernel"]
+
+
+@lru_cache(maxsize=None)
+def one_qubit_kernel(n: int, j: int):
+    """Return kernel(amps, m00, m01, m10, m11) applying a 2x2 matrix to qubit j."""
+    shape = (1 << j, 2, 1 << (n - 1 - j))
+    return _compile(
+        f"""
+def kernel(amps, m00, m01, m10, m11):
+    v = amps.reshape({shape})
+    a0 = v[:, 0]
+    a1 = v[:, 1]
+    new0 = a0 * m00 + a1 * m01
+    new1 = a0 * m10 + a1 * m11
+    v[:, 0] = new0
+    v[:, 1] = new1
+"""
+    )
+
+
+@lru_cache(maxsize=None)
+def diagonal_kernel(n: int, j: int):
+    """Return kernel(amps, d0, d1) scaling the qubit j = 0 and 1 halves."""
+    shape = (1 << j, 2, 1 << (n - 1 - j))
+    return _compile(
+        f"""
+def kernel(amps, d0, d1):
+    v = amps.reshape({shape})
+    if d0 != 1:
+        v[:, 0] *= d0
+    if d1 != 1:
+        v[:, 1] *= d1
+"""
+    )
+
+
+@lru_cache(maxsize=None)
+def cx_kernel(n: int, j: int, k: int):
+    """Return kernel(amps) applying CX with control qubit j and target qubit k."""
+    lo, hi = min(j, k), max(j, k)
+    shape = (1 << lo, 2, 1 << (hi - lo - 1), 2, 1 << (n - 1 - hi))
+    # Index the control=1 subspace with the target bit at 0 and at 1
+    bits0 = {j: 1, k: 0}
+    bits1 = {j: 1, k: 1}
+    idx0 = f"[:, {bits0[lo]}, :, {bits0[hi]}, :]"
+    idx1 = f"[:, {bits1[lo]}, :, {bits1[hi]}, :]"
+    return _compile(
+        f"""
+def kernel(amps):
+    v = amps.reshape({shape})
+    tmp = v{idx0}.copy()
+    v{idx0} = v{idx1}
+    v{idx1} = tmp
+"""
+    )
+
+
+def _insert_zero_bit(i, sh):
+    """Insert a 0 bit at position sh of i, shifting the higher bits up by one."""
+    low = i & ((1 << sh) - 1)
+    return ((i >> sh) << (sh + 1)) | low
+
+
+if NUMBA_AVAILABLE:
+    _insert_zero_bit = njit(inline="always")(_insert_zero_bit)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def apply_1q(amps, j, n, m00, m01, m10, m11):
+        """Apply [[m00, m01], [m10, m11]] to qubit j of an n-qubit state."""
+        sh = n - 1 - j
+        stride = 1 << sh
+        for p in prange(1 << (n - 1)):
+            i0 = _insert_zero_bit(p, sh)
+            i1 = i0 | stride
+            a0 = amps[i0]
+            a1 = amps[i1]
+            amps[i0] = m00 * a0 + m01 * a1
+            amps[i1] = m10 * a0 + m11 * a1
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def apply_cx(amps, j, k, n):
+        """Apply CX with control qubit j and target qubit k of an n-qubit state."""
+        ctrl_sh = n - 1 - j
+        trgt_sh = n - 1 - k
+        lo = min(ctrl_sh, trgt_sh)
+        hi = max(ctrl_sh, trgt_sh)
+        for p in prange(1 << (n - 2)):
+            i0 = _insert_zero_bit(_insert_zero_bit(p, lo), hi) | (1 << ctrl_sh)
+            i1 = i0 | (1 << trgt_sh)
+            a0 = amps[i0]
+            amps[i0] = amps[i1]
+            amps[i1] = a0
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def apply_diagonal(amps, j, n, d0, d1):
+        """Scale the amplitudes where qubit j is 0 by d0 and where it is 1 by d1."""
+        sh = n - 1 - j
+        stride = 1 << sh
+        for p in prange(1 << (n - 1)):
+            i0 = _insert_zero_bit(p, sh)
+            amps[i0] *= d0
+            amps[i0 | stride] *= d1
@@ -8,6 +8,7 @@ Example: python3 main.py 1
 import sys
 import os
 import importlib.util
+from functools import lru_cache
 
 
 def load_task(task_number):
@@ -21,10 +22,19 @@ def load_task(task_number):
         return False
 
     try:
-        # Load the task module dynamically
-        spec = importlib.util.spec_from_file_location(f"task{task_number}", task_file)
-        task_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(task_module)
+        # Load the task module dynamically, reusing it if already loaded
+        module_name = f"task{task_number}"
+        if module_name in sys.modules:
+            task_module = sys.modules[module_name]
+        else:
+            spec = importlib.util.spec_from_file_location(module_name, task_file)
+            task_module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = task_module
+            try:
+                spec.loader.exec_module(task_module)
+            except BaseException:
+                del sys.modules[module_name]
+                raise
 
         # Execute the task
         if hasattr(task_module, "run_task"):
@@ -40,12 +50,12 @@ def load_task(task_number):
         return False
 
 
-def list_available_tasks():
-    """List all available tasks in the tasks directory"""
+@lru_cache(maxsize=None)
+def _find_task_numbers():
+    """Scan the tasks directory for task numbers (None if it does not exist)"""
     tasks_dir = "tasks"
     if not os.path.exists(tasks_dir):
-        print("No tasks directory found.")
-        return
+        return None
 
     task_files = [
         f for f in os.listdir(tasks_dir) if f.startswith("task") and f.endswith(".py")
@@ -62,6 +72,15 @@ def list_available_tasks():
             continue
 
     task_numbers.sort()
+    return tuple(task_numbers)
+
+
+def list_available_tasks():
+    """List all available tasks in the tasks directory"""
+    task_numbers = _find_task_numbers()
+    if task_numbers is None:
+        print("No tasks directory found.")
+        return
 
     if task_numbers:
         for num in task_numbers:
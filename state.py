@@ -1,70 +1,302 @@
 """
-Quantum state simulator using functional programming techniques.
+Quantum state simulator backed by a dense NumPy amplitude vector.
 This module implements a quantum state class that supports various quantum gates
-and operations without requiring matrix algebra.
+and operations without requiring full matrix algebra.
 """
 
-from math import sqrt, pi
+from math import pi
 from cmath import exp
-import random
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import blake2b
 from typing import Optional, Dict
-from functional import seq
-from bitarray import frozenbitarray as bitarray
-from bitarray import bitarray as mut_bitarray
+import numpy as np
+import kernels
+from kernels import NUMBA_AVAILABLE, NUMBA_MIN_QUBITS
+
+
+INV_SQRT2 = 1 / np.sqrt(2)
+
+# Single-qubit gate matrices, indexed [new value of qubit, old value of qubit]
+X_GATE = np.array([[0, 1], [1, 0]], dtype=np.complex128)
+S_GATE = np.diag([1, 1j]).astype(np.complex128)
+T_GATE = np.diag([1, exp(1j * pi / 4)]).astype(np.complex128)
+H_GATE = np.array([[1, 1], [1, -1]], dtype=np.complex128) * INV_SQRT2
+GATES = {"x": X_GATE, "s": S_GATE, "t": T_GATE, "h": H_GATE}
+
+# Basis states with a probability below this are treated as zero when reported
+EPSILON = 1e-10
+
+# Process-wide LRU cache mapping a circuit digest to (snapshot, size in bytes),
+# bounded both in entries and in the total bytes of the stored snapshots
+CIRCUIT_CACHE_SIZE = 128
+CIRCUIT_CACHE_BYTES = 256 * 2**20
+_circuit_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_circuit_cache_bytes = 0
+
+
+def _cache_store(digest: str, snapshot, nbytes: int):
+    """Insert a snapshot into the circuit cache, evicting the oldest entries."""
+    global _circuit_cache_bytes
+    if digest in _circuit_cache:
+        _circuit_cache_bytes -= _circuit_cache.pop(digest)[1]
+    _circuit_cache[digest] = (snapshot, nbytes)
+    _circuit_cache_bytes += nbytes
+    while (
+        len(_circuit_cache) > CIRCUIT_CACHE_SIZE
+        or _circuit_cache_bytes > CIRCUIT_CACHE_BYTES
+    ):
+        _circuit_cache_bytes -= _circuit_cache.popitem(last=False)[1][1]
+
+
+def _array_module(backend: str):
+    """Return the array library for a backend: NumPy for "cpu", CuPy for "cuda"."""
+    if backend == "cpu":
+        return np
+    if backend == "cuda":
+        try:
+            import cupy
+        except ImportError as e:
+            raise ImportError(
+                'The "cuda" backend requires CuPy; install it with '
+                'python3 -m pip install ".[cuda]"'
+            ) from e
+        return cupy
+    raise ValueError(f"Unknown backend {backend!r}, expected 'cpu' or 'cuda'")
+
+
+@lru_cache(maxsize=None)
+def _mask(n: int, i: int) -> int:
+    """Mask of n bits with only the i-th (most significant first) bit set"""
+    return 1 << (n - 1 - i)
 
 
-# Helper functions for bit manipulation
-def set_bit(x: bitarray, i: int, v: int) -> bitarray:
-    """Set the i-th bit of bitarray x to value v (0 or 1)"""
-    new = mut_bitarray(x)
-    new[i] = v
-    return bitarray(new)
-
+class State:
+    """
+    Quantum state stored as a dense vector of 2**n_qubits complex amplitudes.
 
-def flip(x: bitarray, i: int) -> bitarray:
-    """Flip (negate) the i-th bit of bitarray x"""
-    mask = bitarray("0" * i + "1" + "0" * (len(x) - i - 1))
-    return x ^ mask
+    Amplitudes are single precision (complex64) by default, which halves the
+    memory traffic of every gate; pass dtype=np.complex128 for double precision.
+    With backend="cuda" the amplitudes live on the GPU as a CuPy array and the
+    same NumPy-style kernels run there.
 
+    The amplitude of basis state |b⟩ lives at index int(b, 2), so qubit j is the
+    j-th most significant bit of the index and axis j of ``amps.reshape((2,) * n)``.
 
-class State:
-    """
-    Quantum state using a dictionary-like structure mapping bitstrings to amplitudes.
+    Gates are recorded in a history and applied lazily by freeze(), which runs
+    whenever the amplitudes are needed. Circuits passed to run() are kept in a
+    process-wide cache, so a circuit with the same history is not simulated
+    again, and consecutive single-qubit gates on the same qubit are fused into
+    one 2x2 matrix applied in a single pass.
     """
 
-    def __init__(self, n_qubits: int, n_bits: int = 0):
+    def __init__(
+        self,
+        n_qubits: int,
+        n_bits: int = 0,
+        dtype=np.complex64,
+        backend: str = "cpu",
+    ):
         """
         Initialize a quantum state with n_qubits qubits and n_bits classical bits.
 
         Args:
             n_qubits: Number of qubits in the system
             n_bits: Number of classical bits for measurement results
+            dtype: Complex dtype of the amplitudes (complex64 or complex128)
+            backend: "cpu" for NumPy or "cuda" for CuPy on the GPU
 
         The state starts in 0...0 (ground state).
         """
         assert n_qubits > 0 and n_bits >= 0
 
+        self._init_attributes(n_qubits, n_bits, dtype, backend)
+        self._allocate()
+
+    def _init_attributes(self, n_qubits: int, n_bits: int, dtype, backend: str):
+        """Set every attribute except the amplitude buffer, which stays None."""
         self.n_qubits = n_qubits
         self.n_bits = n_bits  # Fixed: was m_bits
-        self.state = seq(
-            [
-                (bitarray(format(i, f"0{n_qubits}b")), 1.0 if i == 0 else 0.0)
-                for i in range(2**n_qubits)
-            ]
+        self.dtype = np.dtype(dtype)
+        assert self.dtype.kind == "c"
+        self.backend = backend
+        self.xp = _array_module(backend)
+        self._amps = None
+        self._history = []  # Gates applied since the ground state, e.g. ("cx", 0, 1)
+        # Running hash of the state's configuration and history, the cache key
+        self._digest = blake2b(digest_size=16)
+        self._digest.update(
+            repr((type(self).__name__, n_qubits, self.dtype.str, backend)).encode()
         )
+        self._applied = 0  # Number of history entries reflected in _amps
+        self._tracked = True  # False once amps may have been modified directly
         self.cbits = [0] * n_bits
         self.measurement_qubits = set()  # Track which qubits should be measured
         self.measure_all_flag = False  # Track if measure_all was called
 
+    @classmethod
+    def _empty(
+        cls,
+        n_qubits: int,
+        n_bits: int = 0,
+        dtype=np.complex64,
+        backend: str = "cpu",
+    ):
+        """
+        Create a State without allocating its amplitude buffer.
+
+        The caller is responsible for setting _amps before the state is used.
+        """
+        new_state = cls.__new__(cls)
+        new_state._init_attributes(n_qubits, n_bits, dtype, backend)
+        return new_state
+
+    def _allocate(self):
+        """Allocate the amplitude buffer in the ground state."""
+        self._amps = self.xp.zeros(1 << self.n_qubits, dtype=self.dtype)
+        self._amps[0] = 1.0
+
     def copy(self):
         """Returns a deep copy of the State object."""
-        new_state = State(self.n_qubits, self.n_bits)
-        new_state.state = seq(self.state)
+        new_state = self._empty(self.n_qubits, self.n_bits, self.dtype, self.backend)
+        new_state._amps = self._amps.copy()
+        new_state._history = list(self._history)
+        new_state._digest = self._digest.copy()
+        new_state._applied = self._applied
+        new_state._tracked = self._tracked
         new_state.cbits = list(self.cbits)
         new_state.measurement_qubits = set(self.measurement_qubits)
         new_state.measure_all_flag = self.measure_all_flag
         return new_state
 
+    @property
+    def amps(self) -> np.ndarray:
+        """
+        The amplitude vector, with every recorded gate applied.
+
+        The buffer may be modified in place, so a state whose amps have been
+        accessed directly no longer takes part in the circuit cache.
+        """
+        self.freeze()
+        self._tracked = False
+        return self._amps
+
+    @amps.setter
+    def amps(self, value: np.ndarray):
+        self.freeze()
+        self._tracked = False
+        self._amps = value
+
+    def freeze(self, store: bool = False) -> str:
+        """
+        Apply every recorded gate and return the digest of the gate history.
+
+        If a circuit with the same history has already been simulated in this
+        process, its amplitudes are reused instead of replaying the gates.
+
+        Args:
+            store: Also save the result in the circuit cache. run() sets this;
+                intermediate queries such as print() do not, so the cache only
+                holds finished circuits. Results larger than
+                CIRCUIT_CACHE_BYTES are never stored.
+        """
+        digest = self._digest.hexdigest()
+        if self._applied < len(self._history):
+            ops = self._history[self._applied :]
+            self._applied = len(self._history)
+            cached = _circuit_cache.get(digest) if self._tracked else None
+            if cached is not None:
+                _circuit_cache.move_to_end(digest)
+                self._restore(cached[0])
+                return digest
+            self._replay(ops)
+
+        if store and self._tracked and digest not in _circuit_cache:
+            nbytes = self._nbytes()
+            if nbytes <= CIRCUIT_CACHE_BYTES:
+                _cache_store(digest, self._snapshot(), nbytes)
+        return digest
+
+    def _nbytes(self) -> int:
+        """Size in bytes of the buffers a snapshot copies."""
+        return self._amps.nbytes
+
+    def _record(self, op: tuple):
+        """Append a gate to the history and fold it into the digest."""
+        self._history.append(op)
+        self._digest.update(repr(op).encode())
+
+    def _snapshot(self):
+        """Return a read-only copy of the amplitudes for the circuit cache."""
+        frozen = self._amps.copy()
+        if self.xp is np:  # CuPy arrays have no writeable flag
+            frozen.flags.writeable = False
+        return frozen
+
+    def _restore(self, snapshot):
+        """Load amplitudes previously returned by _snapshot()."""
+        self._amps = snapshot.copy()
+
+    def _replay(self, ops: list):
+        """
+        Apply ops to the amplitudes, fusing consecutive single-qubit gates.
+
+        Single-qubit gates on a qubit are multiplied into a pending 2x2 matrix
+        that is only applied once a CX touches that qubit or the ops run out.
+        """
+        pending = {}
+        for op in ops:
+            if op[0] == "cx":
+                _, j, k = op
+                for q in (j, k):
+                    if q in pending:
+                        self._apply_1q(q, pending.pop(q))
+                self._apply_cx(j, k)
+            else:
+                name, j = op
+                matrix = GATES[name]
+                pending[j] = matrix @ pending[j] if j in pending else matrix
+        for j, matrix in pending.items():
+            self._apply_1q(j, matrix)
+
+    def _check_qubit(self, j: int):
+        """Raise ValueError if j is not a valid qubit index."""
+        if not 0 <= j < self.n_qubits:
+            raise ValueError(
+                f"Qubit index {j} out of range for {self.n_qubits} qubits"
+            )
+
+    def _use_numba(self) -> bool:
+        """Whether gates should dispatch to the compiled kernels."""
+        return (
+            NUMBA_AVAILABLE and self.xp is np and self.n_qubits >= NUMBA_MIN_QUBITS
+        )
+
+    def _apply_1q(self, j: int, matrix: np.ndarray):
+        """Apply a 2x2 matrix to qubit j in one pass over the amplitudes."""
+        # Gates are fused in double precision, then applied at the state's dtype
+        (m00, m01), (m10, m11) = matrix.astype(self.dtype)
+        if m01 == 0 and m10 == 0:
+            # Diagonal (phase) gates only rescale each half
+            if self._use_numba():
+                kernels.apply_diagonal(self._amps, j, self.n_qubits, m00, m11)
+            else:
+                kernels.diagonal_kernel(self.n_qubits, j)(self._amps, m00, m11)
+            return
+        if self._use_numba():
+            kernels.apply_1q(self._amps, j, self.n_qubits, m00, m01, m10, m11)
+        else:
+            kernel = kernels.one_qubit_kernel(self.n_qubits, j)
+            kernel(self._amps, m00, m01, m10, m11)
+
+    def _apply_cx(self, j: int, k: int):
+        """Apply CX with control j and target k to the amplitudes."""
+        if self._use_numba():
+            kernels.apply_cx(self._amps, j, k, self.n_qubits)
+        else:
+            # Swaps the target=0 and target=1 slices of the control=1 subspace
+            kernels.cx_kernel(self.n_qubits, j, k)(self._amps)
+
     def x(self, j: int):
         """
         Apply the NOT gate to the j-th qubit.
@@ -72,7 +304,8 @@ class State:
         This gate flips the basis states where qubit j is present.
         """
         print(f"-> Applying X gate to qubit {j}")
-        self.state = self.state.smap(lambda b, a: (flip(b, j), a))
+        self._check_qubit(j)
+        self._record(("x", j))
         return self
 
     def cx(self, j: int, k: int):
@@ -80,7 +313,11 @@ class State:
         Apply the CX (controlled-NOT) gate with control qubit ctrl (j) and target (k) qubit trgt.
         """
         print(f"-> Applying CX gate with control {j} and target {k}")
-        self.state = self.state.smap(lambda b, a: (b if not b[j] else flip(b, k), a))
+        self._check_qubit(j)
+        self._check_qubit(k)
+        if j == k:
+            raise ValueError("Control and target qubits must be different")
+        self._record(("cx", j, k))
         return self
 
     def s(self, j: int):
@@ -88,7 +325,8 @@ class State:
         Apply the S (phase) gate to the j-th qubit.
         """
         print(f"-> Applying S gate to qubit {j}")
-        self.state = self.state.smap(lambda b, a: (b, (1j ** b[j]) * a))
+        self._check_qubit(j)
+        self._record(("s", j))
         return self
 
     def t(self, j: int):
@@ -96,8 +334,8 @@ class State:
         Apply the T gate to the j-th qubit.
         """
         print(f"-> Applying T gate to qubit {j}")
-        phase = exp(1j * pi / 4)
-        self.state = self.state.smap(lambda b, a: (b, (phase ** b[j]) * a))
+        self._check_qubit(j)
+        self._record(("t", j))
         return self
 
     def h(self, j: int):
@@ -105,18 +343,8 @@ class State:
         Apply the Hadamard gate to the j-th qubit.
         """
         print(f"-> Applying Hadamard gate to qubit {j}")
-        norm = 1 / sqrt(2)
-        # Fixed: Corrected the phase factor
-        self.state = (
-            self.state.smap(
-                lambda b, a: [
-                    (set_bit(b, j, 0), a * norm),
-                    (set_bit(b, j, 1), a * norm * ((-1) ** b[j])),  # Fixed phase
-                ]
-            )
-            .flatten()
-            .reduce_by_key(lambda x, y: x + y)
-        )
+        self._check_qubit(j)
+        self._record(("h", j))
         return self
 
     def measure(self, j: int, cbit: Optional[int] = None):
@@ -129,6 +357,7 @@ class State:
             cbit: Optional classical bit to store the measurement result
         """
         print(f"-> Adding measurement for qubit {j}")
+        self._check_qubit(j)
         self.measurement_qubits.add(j)
         return self
 
@@ -141,43 +370,86 @@ class State:
         self.measure_all_flag = True
         return self
 
+    def _host(self, array) -> np.ndarray:
+        """Return array as a NumPy array, copying it off the GPU if needed."""
+        return array if self.xp is np else self.xp.asnumpy(array)
+
+    def _probabilities(self) -> np.ndarray:
+        """Return |amplitude|^2 for every stored amplitude, on the backend device."""
+        self.freeze()
+        # Square in double precision, directly from the parts to avoid the
+        # sqrt-then-square of np.abs
+        real = self._amps.real.astype(np.float64, copy=False)
+        imag = self._amps.imag.astype(np.float64, copy=False)
+        return real * real + imag * imag
+
+    def _entries(self) -> tuple:
+        """
+        Return the basis states with nonzero probability in ascending order,
+        together with their amplitudes and probabilities.
+        """
+        probs = self._probabilities()
+        # Basis states are stored in numeric order, which is also bitstring order
+        nonzero = self.xp.nonzero(probs > EPSILON)[0]
+        return (
+            self._host(nonzero),
+            self._host(self._amps[nonzero]),
+            self._host(probs[nonzero]),
+        )
+
+    def _marginal(self, qubits: list) -> tuple:
+        """
+        Return every outcome of measuring the sorted qubits, as integers, and
+        the probability of each.
+
+        The marginal is reduced on the backend device and only the result, of
+        size 2**len(qubits), is returned to the host for sampling.
+        """
+        # The all-qubits shortcut below is only valid for in-range indices
+        for q in qubits:
+            self._check_qubit(q)
+        probs = self._probabilities()
+        if len(qubits) < self.n_qubits:
+            # Merge runs of adjacent measured or unmeasured qubits into single
+            # axes, so the reduction walks as few axes as possible
+            shape, unmeasured, previous = [], [], None
+            for q in range(self.n_qubits):
+                measured = q in qubits
+                if measured == previous:
+                    shape[-1] *= 2
+                else:
+                    if not measured:
+                        unmeasured.append(len(shape))
+                    shape.append(2)
+                previous = measured
+            probs = probs.reshape(shape).sum(axis=tuple(unmeasured)).ravel()
+        return np.arange(len(probs)), self._host(probs)
+
     def get_probabilities(self) -> Dict[str, float]:
         """
         Get the probability distribution of the current quantum state.
 
         Returns:
-            Dictionary mapping bitstrings to their probabilities
-        """
-        probs = {}
-        for i in range(2**self.n_qubits):
-            bitstring = format(i, f"0{self.n_qubits}b")
-            probs[bitstring] = 0.0
-            
-        for bitstring, amplitude in self.state:
-            prob = abs(amplitude) ** 2
-            probs[bitstring.to01()] = prob
-        return probs
+            Dictionary mapping bitstrings to their probabilities, omitting
+            basis states with zero probability
+        """
+        basis, _, probs = self._entries()
+        return {
+            format(int(b), f"0{self.n_qubits}b"): float(p) for b, p in zip(basis, probs)
+        }
 
     def __str__(self):
         """
         Return a string representation of the quantum state.
 
-        Format: Each bitstring with its corresponding amplitude.
+        Format: Each bitstring with a nonzero amplitude, in basis-state order.
         """
-        self.state = self.state.sorted(key=lambda x: x[0].to01())
-
-        state_dict = {}
-        for bitstring, amplitude in self.state:
-            state_dict[bitstring.to01()] = amplitude
-
-        all_states = []
-        for i in range(2**self.n_qubits):
-            bitstring = format(i, f"0{self.n_qubits}b")
-            amplitude = state_dict.get(bitstring, 0.0)
-            all_states.append((bitstring, amplitude))
-
+        basis, amps, _ = self._entries()
         result = "Quantum state:\n" + "\n".join(
-            [f"|{b}⟩: {a:.3f}" for b, a in all_states]
+            [
+                f"|{format(int(b), f'0{self.n_qubits}b')}⟩: {complex(a):.3f}"
+                for b, a in zip(basis, amps)
+            ]
         )
 
         # Add classical register values if they exist
@@ -187,7 +459,7 @@ class State:
         return result
 
 
-def run(state: State, shots: int = 1024) -> Dict[str, int]:
+def run(state: State, shots: int = 1024, seed: Optional[int] = None) -> Dict[str, int]:
     """
     Run measurements on a prepared quantum state multiple times.
     Only measures qubits that were marked for measurement via measure() or measure_all().
@@ -195,9 +467,12 @@ def run(state: State, shots: int = 1024) -> Dict[str, int]:
     Args:
         state: A prepared quantum state (circuit already applied)
         shots: Number of measurement shots
+        seed: Optional seed for the random generator, for reproducible counts
 
     Returns:
-        Dictionary mapping measurement outcomes to their counts
+        Dictionary mapping measurement outcomes to their counts, sorted by
+        outcome. Only outcomes observed at least once are included, for both
+        State and SparseState.
     """
     if shots <= 0:
         raise ValueError("Shots must be a positive integer")
@@ -218,55 +493,135 @@ def run(state: State, shots: int = 1024) -> Dict[str, int]:
         print(f"Running {shots} measurements on qubits {qubits_to_measure}...")
         n_measured_qubits = len(qubits_to_measure)
 
-    counts = {}
-    for i in range(2**n_measured_qubits):
-        outcome = format(i, f"0{n_measured_qubits}b")
-        counts[outcome] = 0
-
-    for _ in range(shots):
-        # Work on a copy of the state to avoid modifying the original
-        temp_state = state.copy()
-
-        # Measure each specified qubit
-        result_bits = ["0"] * state.n_qubits
-        for qubit in qubits_to_measure:
-            # Convert state to a regular list for easier manipulation
-            current_state = list(temp_state.state)
-
-            # Compute the probability of measuring 0
-            prob_0 = sum(abs(a) ** 2 for b, a in current_state if not b[qubit])
-
-            measurement = int(random.random() >= prob_0)
-            result_bits[qubit] = str(measurement)
-
-            # Collapse the state based on measurement
-            if measurement == 0:
-                # Keep only states where qubit is 0, and normalize
-                new_state = [
-                    (b, a / sqrt(prob_0))
-                    for b, a in current_state
-                    if not b[qubit] and prob_0 > 0
-                ]
-            else:
-                # Keep only states where qubit is 1, and normalize
-                prob_1 = 1.0 - prob_0
-                new_state = [
-                    (b, a / sqrt(prob_1))
-                    for b, a in current_state
-                    if b[qubit] and prob_1 > 0
-                ]
-
-            # Convert back to seq
-            temp_state.state = seq(new_state)
-
-        # Create result string from measured qubits only
-        if state.measure_all_flag:
-            result = "".join(result_bits)
-        else:
-            # Only include measured qubits in result
-            result = "".join([result_bits[q] for q in qubits_to_measure])
+    # Measurement of an unchanged state is a fixed categorical distribution, so
+    # sample every shot at once from the marginal over the measured qubits
+    state.freeze(store=True)
+    outcomes, probs = state._marginal(qubits_to_measure)
+    rng = np.random.default_rng(seed)
+    # Probabilities are float64; renormalize so single-precision states sum to 1
+    samples = rng.multinomial(shots, probs / probs.sum())
 
-        counts[result] = counts.get(result, 0) + 1
+    counts = {
+        format(int(o), f"0{n_measured_qubits}b"): int(c)
+        for o, c in zip(outcomes, samples)
+        if c
+    }
 
     # Return sorted dictionary by binary string keys
     return dict(sorted(counts.items()))
+
+
+class SparseState(State):
+    """
+    Quantum state storing only its nonzero amplitudes, as two parallel arrays.
+
+    Always runs on the CPU backend.
+
+    basis holds the basis states as uint64 integers and amps their amplitudes, so
+    memory scales with the number of nonzero amplitudes rather than 2**n_qubits.
+    This suits circuits on many qubits that stay in a small superposition, such as
+    GHZ state preparation. At most 64 qubits are supported.
+    """
+
+    def __init__(self, n_qubits: int, n_bits: int = 0, dtype=np.complex64):
+        """Initialize a sparse quantum state; see State.__init__."""
+        assert n_qubits <= 64
+        super().__init__(n_qubits, n_bits, dtype)
+
+    def _init_attributes(self, n_qubits: int, n_bits: int, dtype, backend: str):
+        """Set every attribute except the basis and amplitude buffers."""
+        super()._init_attributes(n_qubits, n_bits, dtype, backend)
+        self._basis = None
+
+    def _allocate(self):
+        """Store the ground state as a single basis state with amplitude 1."""
+        self._basis = np.zeros(1, dtype=np.uint64)
+        self._amps = np.ones(1, dtype=self.dtype)
+
+    def copy(self):
+        """Returns a deep copy of the SparseState object."""
+        new_state = super().copy()
+        new_state._basis = self._basis.copy()
+        return new_state
+
+    @property
+    def basis(self) -> np.ndarray:
+        """The basis states of amps, with every recorded gate applied."""
+        self.freeze()
+        self._tracked = False
+        return self._basis
+
+    def _nbytes(self) -> int:
+        """Size in bytes of the basis and amplitude buffers."""
+        return self._basis.nbytes + self._amps.nbytes
+
+    def _snapshot(self):
+        """Return read-only copies of the basis states and amplitudes."""
+        basis = self._basis.copy()
+        basis.flags.writeable = False
+        return basis, super()._snapshot()
+
+    def _restore(self, snapshot):
+        """Load basis states and amplitudes previously returned by _snapshot()."""
+        basis, amps = snapshot
+        self._basis = basis.copy()
+        super()._restore(amps)
+
+    def _apply_1q(self, j: int, matrix: np.ndarray):
+        """Apply a 2x2 matrix to qubit j, merging basis states that coincide."""
+        (m00, m01), (m10, m11) = matrix.astype(self.dtype)
+        m = np.uint64(_mask(self.n_qubits, j))
+        bit = (self._basis & m) != 0
+        if m01 == 0 and m10 == 0:
+            self._amps = self._amps * np.where(bit, m11, m00)
+            return
+        if m00 == 0 and m11 == 0:
+            # Permutation (X-like) gates only move amplitudes between basis states
+            self._amps = self._amps * np.where(bit, m01, m10)
+            self._basis = self._basis ^ m
+            return
+
+        # Each basis state feeds both values of qubit j; sum the duplicates
+        b0 = self._basis & ~m
+        basis = np.concatenate((b0, b0 | m))
+        amps = np.concatenate(
+            (np.where(bit, m01, m00) * self._amps, np.where(bit, m11, m10) * self._amps)
+        )
+        basis, inverse = np.unique(basis, return_inverse=True)
+        merged = np.zeros(len(basis), dtype=self.dtype)
+        np.add.at(merged, inverse, amps)
+
+        # Drop amplitudes that cancelled out so the state stays sparse
+        keep = merged.real**2 + merged.imag**2 > EPSILON
+        self._basis = basis[keep]
+        self._amps = merged[keep]
+
+    def _apply_cx(self, j: int, k: int):
+        """Apply CX with control j and target k by flipping the target bit."""
+        control = np.uint64(_mask(self.n_qubits, j))
+        target = np.uint64(_mask(self.n_qubits, k))
+        self._basis = np.where(
+            (self._basis & control) != 0, self._basis ^ target, self._basis
+        )
+
+    def _entries(self) -> tuple:
+        """Sort the stored basis states, which gates leave in arbitrary order."""
+        probs = self._probabilities()
+        order = np.argsort(self._basis)
+        order = order[probs[order] > EPSILON]
+        return self._basis[order], self._amps[order], probs[order]
+
+    def _marginal(self, qubits: list) -> tuple:
+        """
+        Return the outcomes of measuring the sorted qubits that have nonzero
+        probability, as integers, and the probability of each.
+        """
+        for q in qubits:
+            self._check_qubit(q)
+        probs = self._probabilities()
+        outcomes = np.zeros(len(self._basis), dtype=np.uint64)
+        for q in qubits:
+            bit = (self._basis >> np.uint64(self.n_qubits - 1 - q)) & np.uint64(1)
+            outcomes = (outcomes << np.uint64(1)) | bit
+        outcomes, inverse = np.unique(outcomes, return_inverse=True)
+        return outcomes, np.bincount(inverse, weights=probs, minlength=len(outcomes))
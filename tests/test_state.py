@@ -0,0 +1,171 @@
+import random
+
+import numpy as np
+import pytest
+
+import state
+from kernels import NUMBA_AVAILABLE
+from state import SparseState, State, run
+
+TOLERANCE = 1e-6
+
+SINGLE_QUBIT_GATES = {
+    "h": np.array([[1, 1], [1, -1]]) / np.sqrt(2),
+    "x": np.array([[0, 1], [1, 0]]),
+    "s": np.diag([1, 1j]),
+    "t": np.diag([1, np.exp(1j * np.pi / 4)]),
+}
+
+
+def random_circuit(n_qubits, seed, n_gates=30):
+    """Return a list of gates such as ("h", 0) or ("cx", 0, 1)."""
+    rnd = random.Random(seed)
+    ops = []
+    for _ in range(n_gates):
+        name = rnd.choice(["h", "x", "s", "t", "cx"])
+        j = rnd.randrange(n_qubits)
+        if name == "cx":
+            k = rnd.choice([q for q in range(n_qubits) if q != j])
+            ops.append(("cx", j, k))
+        else:
+            ops.append((name, j))
+    return ops
+
+
+def reference_amplitudes(n_qubits, ops):
+    """Simulate ops with full 2**n x 2**n matrices, qubit 0 most significant."""
+    amps = np.zeros(2**n_qubits, dtype=np.complex128)
+    amps[0] = 1
+    for op in ops:
+        if op[0] == "cx":
+            _, j, k = op
+            unitary = np.zeros((2**n_qubits, 2**n_qubits))
+            for b in range(2**n_qubits):
+                control = (b >> (n_qubits - 1 - j)) & 1
+                unitary[b ^ (control << (n_qubits - 1 - k)), b] = 1
+        else:
+            name, j = op
+            unitary = np.array([[1]])
+            for q in range(n_qubits):
+                factor = SINGLE_QUBIT_GATES[name] if q == j else np.eye(2)
+                unitary = np.kron(unitary, factor)
+        amps = unitary @ amps
+    return amps
+
+
+def apply(state_obj, ops):
+    for op in ops:
+        getattr(state_obj, op[0])(*op[1:])
+    return state_obj
+
+
+def dense_amplitudes(state_obj):
+    """Return the amplitudes of a State or SparseState as a dense vector."""
+    if isinstance(state_obj, SparseState):
+        amps = np.zeros(2**state_obj.n_qubits, dtype=np.complex128)
+        amps[state_obj.basis.astype(np.int64)] = state_obj.amps
+        return amps
+    return np.asarray(state_obj.amps)
+
+
+@pytest.fixture(params=["numpy", "numba"])
+def kernel_path(request, monkeypatch):
+    if request.param == "numba":
+        if not NUMBA_AVAILABLE:
+            pytest.skip("numba is not installed")
+        monkeypatch.setattr(state, "NUMBA_MIN_QUBITS", 0)
+    else:
+        monkeypatch.setattr(state, "NUMBA_MIN_QUBITS", 64)
+    return request.param
+
+
+@pytest.mark.parametrize("dtype", [np.complex64, np.complex128])
+@pytest.mark.parametrize("n_qubits", [2, 3, 5])
+@pytest.mark.parametrize("seed", range(4))
+def test_state_matches_reference(kernel_path, dtype, n_qubits, seed):
+    ops = random_circuit(n_qubits, seed)
+    result = apply(State(n_qubits, dtype=dtype), ops)
+    np.testing.assert_allclose(
+        dense_amplitudes(result), reference_amplitudes(n_qubits, ops), atol=TOLERANCE
+    )
+
+
+@pytest.mark.parametrize("dtype", [np.complex64, np.complex128])
+@pytest.mark.parametrize("n_qubits", [2, 3, 5])
+@pytest.mark.parametrize("seed", range(4))
+def test_sparse_state_matches_reference(dtype, n_qubits, seed):
+    ops = random_circuit(n_qubits, seed)
+    result = apply(SparseState(n_qubits, dtype=dtype), ops)
+    np.testing.assert_allclose(
+        dense_amplitudes(result), reference_amplitudes(n_qubits, ops), atol=TOLERANCE
+    )
+
+
+def test_copy_is_independent():
+    original = State(2).h(0)
+    copied = original.copy().cx(0, 1)
+    assert original.get_probabilities() == pytest.approx(
+        {"00": 0.5, "10": 0.5}, abs=TOLERANCE
+    )
+    assert copied.get_probabilities() == pytest.approx(
+        {"00": 0.5, "11": 0.5}, abs=TOLERANCE
+    )
+
+
+def test_get_probabilities_of_superposition():
+    probs = State(1).h(0).get_probabilities()
+    assert probs == pytest.approx({"0": 0.5, "1": 0.5}, abs=TOLERANCE)
+
+
+@pytest.mark.parametrize("cls", [State, SparseState])
+def test_get_probabilities_sum_to_one_on_many_qubits(cls):
+    n_qubits = 18
+    uniform = cls(n_qubits)
+    for q in range(n_qubits):
+        uniform.h(q)
+    probs = uniform.get_probabilities()
+    assert len(probs) == 2**n_qubits
+    assert sum(probs.values()) == pytest.approx(1.0, abs=TOLERANCE)
+    assert min(probs.values()) == pytest.approx(2.0**-n_qubits, rel=TOLERANCE)
+
+
+@pytest.mark.parametrize("cls", [State, SparseState])
+def test_run_reports_observed_outcomes_only(cls):
+    circuit = cls(3).h(0).cx(0, 2).measure(0).measure(2)
+    counts = run(circuit, 1000, seed=0)
+    assert set(counts) == {"00", "11"}
+    assert sum(counts.values()) == 1000
+
+
+def test_run_reuses_cached_circuit(monkeypatch):
+    run(State(3).h(0).cx(0, 1).measure_all(), 10)
+
+    def fail(self, ops):
+        raise AssertionError("cached circuit was replayed")
+
+    monkeypatch.setattr(State, "_replay", fail)
+    counts = run(State(3).h(0).cx(0, 1).measure_all(), 10, seed=0)
+    assert set(counts) <= {"000", "110"}
+
+
+def test_invalid_qubit_raises():
+    with pytest.raises(ValueError):
+        State(2).h(2)
+    with pytest.raises(ValueError):
+        State(2).cx(1, 1)
+
+
+@pytest.mark.parametrize("cls", [State, SparseState])
+def test_measure_invalid_qubit_raises(cls):
+    with pytest.raises(ValueError):
+        cls(2).h(0).measure(5)
+    with pytest.raises(ValueError):
+        cls(2).measure(-1)
+
+
+@pytest.mark.parametrize("cls", [State, SparseState])
+def test_run_rejects_out_of_range_measured_qubits(cls):
+    circuit = cls(2).h(0).h(1).measure(0)
+    circuit.measurement_qubits.add(5)
+    with pytest.raises(ValueError):
+        run(circuit, 10)